@@ -1,18 +1,76 @@
 import logging
-import json
-from ai import generateText
-from groq import groq
-from utils import setup_logger
+import functools
+import hashlib
+import re
+from groq import Groq
+from utils import setup_logger, truncate_text
 
 # Setup logger
 logger = setup_logger()
 
+# Maximum number of LLM-generated sub-queries used for retrieval
+MAX_SUB_QUERIES = 5
+
+# Prompt budget: the llama3 models have an 8192-token window shared by prompt and report
+MODEL_CONTEXT_TOKENS = 8192
+MAX_REPORT_TOKENS = 4000
+PROMPT_OVERHEAD_TOKENS = 400  # System prompt, query and instructions
+CONTEXT_TOKEN_BUDGET = MODEL_CONTEXT_TOKENS - MAX_REPORT_TOKENS - PROMPT_OVERHEAD_TOKENS
+
+# Context size limits, splitting the budget evenly between pages and documents
+MAX_CONTEXT_PAGES = 10
+MAX_CONTEXT_DOCS = 5
+CHARS_PER_TOKEN = 4
+PAGE_PREVIEW_CHARS = CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN // (2 * MAX_CONTEXT_PAGES)
+DOC_PREVIEW_CHARS = CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN // (2 * MAX_CONTEXT_DOCS)
+
+@functools.lru_cache(maxsize=1)
+def load_tokenizer():
+    """
+    Load the tokenizer used to measure the prompt.
+    
+    cl100k_base only approximates the llama3/mixtral tokenizers, and tiktoken downloads
+    it on first use. Returns None when it can't be loaded, e.g. offline, in which case
+    prompt size is estimated from CHARS_PER_TOKEN.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating tokens from characters: {e}")
+        return None
+
 class ResearchAgent:
     def __init__(self):
         """Initialize the research agent"""
         logger.info("Initializing Research Agent")
+        
+        # Sub-queries already generated, keyed by (query, model)
+        self.sub_query_cache = {}
+        
+        # Groq client, created on first use so a missing API key surfaces as a report error
+        self.client = None
     
-    def analyze(self, query, crawled_data, knowledge_base, model="groq/llama3-8b-8192"):
+    def _get_client(self):
+        """Return the Groq client, creating it if needed"""
+        if self.client is None:
+            self.client = Groq()
+        return self.client
+    
+    def _complete(self, model, system_prompt, user_prompt, temperature, max_tokens, stream=False):
+        """Send a chat completion request to Groq"""
+        return self._get_client().chat.completions.create(
+            model=model.removeprefix("groq/"),
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=stream
+        )
+    
+    def analyze(self, query, crawled_data, knowledge_base, model="groq/llama3-8b-8192", do_not_cache=False, placeholder=None):
         """
         Analyze crawled data and generate a report.
         
@@ -21,23 +79,85 @@ class ResearchAgent:
             crawled_data (dict): Crawled website data
             knowledge_base (KnowledgeBase): Knowledge base instance
             model (str): AI model to use
+            do_not_cache (bool): Bypass the semantic report cache
+            placeholder: Optional Streamlit placeholder the report is streamed into
             
         Returns:
             str: Markdown report
         """
         logger.info(f"Starting analysis with model {model}")
         
+        # Return a cached report for a similar query over the same crawl, before any model calls
+        report_cache = None if do_not_cache else knowledge_base.report_cache
+        corpus_hash = None
+        if report_cache is not None:
+            corpus_hash = self._corpus_hash(crawled_data)
+            cached_report = report_cache.lookup(query, corpus_hash, model)
+            if cached_report is not None:
+                if placeholder is not None:
+                    placeholder.markdown(cached_report)
+                return cached_report
+        
         # Get relevant documents from knowledge base
-        relevant_docs = knowledge_base.query(query, n_results=5)
+        relevant_docs = self._retrieve_documents(query, knowledge_base, model, n_results=MAX_CONTEXT_DOCS)
         
         # Prepare context from crawled data and knowledge base
         context = self._prepare_context(query, crawled_data, relevant_docs)
         
         # Generate report using AI
-        report = self._generate_report(query, context, model)
+        report = self._generate_report(query, context, model, placeholder, report_cache, corpus_hash)
         
         return report
     
+    def _decompose_query(self, query, model):
+        """Split the research query into focused sub-queries for retrieval"""
+        if (query, model) in self.sub_query_cache:
+            return self.sub_query_cache[(query, model)]
+        
+        try:
+            response = self._complete(
+                model,
+                "You break research questions into short, focused search queries.",
+                f"""Research Query: {query}
+
+List 3 to {MAX_SUB_QUERIES} search queries covering the main themes and entities of this research query.
+Return one query per line with no numbering or commentary.
+""",
+                temperature=0,
+                max_tokens=200
+            )
+            text = response.choices[0].message.content or ""
+        except Exception as e:
+            logger.warning(f"Error decomposing query, using it as-is: {e}")
+            return [query]
+        
+        sub_queries = [query]
+        for line in text.splitlines():
+            line = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", line).strip()
+            if line and line not in sub_queries:
+                sub_queries.append(line)
+        sub_queries = sub_queries[:MAX_SUB_QUERIES + 1]
+        
+        logger.info(f"Decomposed query into {len(sub_queries) - 1} sub-queries")
+        self.sub_query_cache[(query, model)] = sub_queries
+        return sub_queries
+    
+    def _retrieve_documents(self, query, knowledge_base, model, n_results=5):
+        """Retrieve documents for the query and its sub-queries in one batched lookup"""
+        sub_queries = self._decompose_query(query, model)
+        
+        # Merge results, keeping the closest match for each source
+        best = {}
+        for docs in knowledge_base.query_many(sub_queries, n_results=n_results):
+            for doc in docs:
+                key = doc["metadata"].get("url") or doc["text"]
+                distance = doc["distance"] if doc["distance"] is not None else float("inf")
+                if key not in best or distance < best[key][0]:
+                    best[key] = (distance, doc)
+        
+        ranked = sorted(best.values(), key=lambda item: item[0])
+        return [doc for _, doc in ranked[:n_results]]
+    
     def _prepare_context(self, query, crawled_data, relevant_docs):
         """Prepare context for the AI model"""
         # Extract summary of crawled data
@@ -47,11 +167,11 @@ class ResearchAgent:
         }
         
         # Add page summaries (limit to avoid token limits)
-        for url, data in list(crawled_data.items())[:10]:  # Limit to 10 pages
+        for url, data in list(crawled_data.items())[:MAX_CONTEXT_PAGES]:
             page_summary = {
                 "url": url,
                 "title": data.get("metadata", {}).get("title", "No title"),
-                "content_preview": data.get("content", "")[:500] + "..." if len(data.get("content", "")) > 500 else data.get("content", ""),
+                "content_preview": truncate_text(data.get("content", ""), PAGE_PREVIEW_CHARS),
                 "num_links": len(data.get("links", []))
             }
             crawled_summary["pages"].append(page_summary)
@@ -60,7 +180,7 @@ class ResearchAgent:
         kb_docs = []
         for doc in relevant_docs:
             kb_docs.append({
-                "text": doc["text"][:1000] + "..." if len(doc["text"]) > 1000 else doc["text"],
+                "text": truncate_text(doc["text"], DOC_PREVIEW_CHARS),
                 "source": doc["metadata"].get("url", "Unknown source")
             })
         
@@ -73,8 +193,51 @@ class ResearchAgent:
         
         return context
     
-    def _generate_report(self, query, context, model):
-        """Generate report using AI"""
+    def _context_sections(self, context):
+        """Yield the context as compact Markdown sections, most relevant first"""
+        for i, doc in enumerate(context["relevant_documents"], 1):
+            yield f"## Document {i}\nSource: {doc['source']}\n{doc['text']}\n"
+        
+        crawled_data = context["crawled_data"]
+        yield f"Pages crawled: {crawled_data['num_pages']}\n"
+        for i, page in enumerate(crawled_data["pages"], 1):
+            yield f"## Page {i}: {page['title']}\nURL: {page['url']}\nLinks: {page['num_links']}\n{page['content_preview']}\n"
+    
+    def _render_context(self, context, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Render the context for the prompt, truncated at the token budget"""
+        tokenizer = load_tokenizer()
+        
+        sections = []
+        used_tokens = 0
+        for section in self._context_sections(context):
+            tokens = tokenizer.encode(section) if tokenizer is not None else None
+            num_tokens = len(tokens) if tokens is not None else -(-len(section) // CHARS_PER_TOKEN)
+            
+            remaining = token_budget - used_tokens
+            if num_tokens > remaining:
+                if tokens is not None:
+                    sections.append(tokenizer.decode(tokens[:remaining]))
+                else:
+                    sections.append(section[:remaining * CHARS_PER_TOKEN])
+                break
+            sections.append(section)
+            used_tokens += num_tokens
+        
+        return "\n".join(sections)
+    
+    @staticmethod
+    def _corpus_hash(crawled_data):
+        """Hash the crawled pages, so cached reports are only reused for the same crawl"""
+        digest = hashlib.sha256()
+        for url in sorted(crawled_data):
+            digest.update(url.encode())
+            digest.update(b"\0")
+            digest.update(crawled_data[url].get("content", "").encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+    
+    def _generate_report(self, query, context, model, placeholder=None, report_cache=None, corpus_hash=None):
+        """Generate report using AI, caching it when a report cache is given"""
         try:
             # Prepare system prompt
             system_prompt = """You are a research assistant that analyzes web content and generates comprehensive reports.
@@ -94,22 +257,27 @@ Base your analysis only on the provided context. If the context is insufficient,
             user_prompt = f"""Research Query: {query}
 
 Context:
-{json.dumps(context, indent=2)}
+{self._render_context(context)}
 
 Please generate a comprehensive research report based on this information.
 """
 
-            # Generate text using AI SDK
-            response = generateText({
-                "model": groq(model),
-                "system": system_prompt,
-                "prompt": user_prompt,
-                "temperature": 0.7,
-                "max_tokens": 4000
-            })
+            # Stream the report, rendering partial output as it arrives
+            stream = self._complete(model, system_prompt, user_prompt, temperature=0.7, max_tokens=MAX_REPORT_TOKENS, stream=True)
+            report = ""
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                report += delta
+                if placeholder is not None:
+                    placeholder.markdown(report)
             
-            logger.info(f"Generated report with {len(response.text)} characters")
-            return response.text
+            logger.info(f"Generated report with {len(report)} characters")
+            # Never cache an empty report
+            if report_cache is not None and report.strip():
+                report_cache.store(query, corpus_hash, model, report)
+            return report
             
         except Exception as e:
             logger.error(f"Error generating report: {e}")
@@ -1,8 +1,12 @@
 import streamlit as st
 import networkx as nx
-import matplotlib.pyplot as plt
+import igraph as ig
+import numpy as np
+from matplotlib.figure import Figure
+from io import BytesIO
 import json
 import time
+import asyncio
 from crawler import ClearnetCrawler
 from knowledge_base import KnowledgeBase
 from agent import ResearchAgent
@@ -12,6 +16,73 @@ import os
 # Setup logger
 logger = setup_logger()
 
+async def run_crawl(crawler, seed_url, status_text):
+    """Crawl from the seed URL, collecting pages, documents and link edges in one pass"""
+    crawled_data = {}
+    texts, metadatas, edges = [], [], []
+    timestamp = get_current_timestamp()
+    
+    async for url, data in crawler.crawl_stream(seed_url):
+        crawled_data[url] = data
+        texts.append(data["content"])
+        metadatas.append({"url": url, "timestamp": timestamp})
+        edges.extend((url, link) for link in data.get("links", []))
+        status_text.text(f"Step 1/3: Crawling websites... ({len(crawled_data)} pages)")
+    
+    return crawled_data, texts, metadatas, edges
+
+# Graphs with more nodes than this compute degrees from a sparse adjacency matrix
+LARGE_GRAPH_NODES = 10_000
+
+def node_degrees(G):
+    """Return each node's total (in + out) degree"""
+    if G.number_of_nodes() <= LARGE_GRAPH_NODES:
+        return dict(G.degree())
+    
+    A = nx.to_scipy_sparse_array(G, weight=None)
+    degrees = np.asarray(A.sum(axis=0)).ravel() + np.asarray(A.sum(axis=1)).ravel()
+    return dict(zip(G.nodes(), degrees.tolist()))
+
+@st.cache_data(max_entries=32)
+def compute_layout(nodes, edges):
+    """Compute a Fruchterman-Reingold layout with igraph's C implementation (cached per graph)"""
+    index = {node: i for i, node in enumerate(nodes)}
+    graph = ig.Graph(n=len(nodes), edges=[(index[u], index[v]) for u, v in edges], directed=True)
+    layout = graph.layout_fruchterman_reingold()
+    return {node: tuple(layout[i]) for i, node in enumerate(nodes)}
+
+@st.cache_data(max_entries=8)
+def render_graph(nodes, edges):
+    """Draw the link network as PNG bytes (cached per graph; bytes pickle, unlike the figure)"""
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    pos = compute_layout(nodes, edges)
+    
+    # Not registered with pyplot, so it is freed once rendered
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    nx.draw(
+        G, 
+        pos, 
+        with_labels=False, 
+        node_color='skyblue', 
+        node_size=100, 
+        edge_color='gray', 
+        arrows=True,
+        ax=ax
+    )
+    
+    # Add labels to larger nodes
+    node_sizes = {node: degree * 10 for node, degree in node_degrees(G).items()}
+    large_nodes = [node for node, size in node_sizes.items() if size > 50]
+    labels = {node: node.split('/')[-1] for node in large_nodes}
+    nx.draw_networkx_labels(G, pos, labels=labels, font_size=8, ax=ax)
+    
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
 # Page config
 st.set_page_config(
     page_title="Clearnet Research Assistant",
@@ -123,34 +194,31 @@ with tab1:
                 
                 # Step 1: Crawling
                 status_text.text("Step 1/3: Crawling websites...")
-                crawled_data = crawler.crawl(seed_url)
+                crawled_data, texts, metadatas, edges = asyncio.run(run_crawl(crawler, seed_url, status_text))
                 st.session_state.crawled_data = crawled_data
                 progress.progress(33)
                 
                 # Step 2: Indexing
                 status_text.text("Step 2/3: Indexing content...")
-                for url, data in crawled_data.items():
-                    st.session_state.knowledge_base.add_document(
-                        text=data["content"],
-                        metadata={"url": url, "timestamp": get_current_timestamp()}
-                    )
+                st.session_state.knowledge_base.add_documents(texts, metadatas)
                 progress.progress(66)
                 
                 # Step 3: Analysis
                 status_text.text("Step 3/3: Analyzing and generating report...")
+                report_placeholder = st.empty()
                 st.session_state.report = st.session_state.agent.analyze(
                     query=query,
                     crawled_data=crawled_data,
                     knowledge_base=st.session_state.knowledge_base,
-                    model=model
+                    model=model,
+                    placeholder=report_placeholder
                 )
+                report_placeholder.empty()
                 
                 # Create graph
                 G = nx.DiGraph()
-                for url, data in crawled_data.items():
-                    G.add_node(url)
-                    for link in data.get("links", []):
-                        G.add_edge(url, link)
+                G.add_nodes_from(crawled_data)
+                G.add_edges_from(edges)
                 st.session_state.graph = G
                 
                 progress.progress(100)
@@ -181,26 +249,8 @@ with tab2:
         st.markdown("This graph shows the connections between crawled pages.")
         
         # Create visualization
-        fig, ax = plt.subplots(figsize=(10, 8))
-        pos = nx.spring_layout(st.session_state.graph)
-        nx.draw(
-            st.session_state.graph, 
-            pos, 
-            with_labels=False, 
-            node_color='skyblue', 
-            node_size=100, 
-            edge_color='gray', 
-            arrows=True,
-            ax=ax
-        )
-        
-        # Add labels to larger nodes
-        node_sizes = {node: st.session_state.graph.degree(node) * 10 for node in st.session_state.graph.nodes()}
-        large_nodes = [node for node, size in node_sizes.items() if size > 50]
-        labels = {node: node.split('/')[-1] for node in large_nodes}
-        nx.draw_networkx_labels(st.session_state.graph, pos, labels=labels, font_size=8, ax=ax)
-        
-        st.pyplot(fig)
+        G = st.session_state.graph
+        st.image(render_graph(tuple(G.nodes()), tuple(G.edges())))
         
         # Network statistics
         st.markdown("### Network Statistics")
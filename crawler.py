@@ -1,7 +1,16 @@
-import requests
+import asyncio
+import httpx
+from collections import deque
+from functools import lru_cache
+from itertools import islice
 from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
 import time
 import random
+import xxhash
+import dbm
+import shelve
+import threading
 import urllib.robotparser
 from urllib.parse import urlparse, urljoin
 import logging
@@ -10,8 +19,29 @@ from utils import setup_logger, get_random_delay
 # Setup logger
 logger = setup_logger()
 
+# robots.txt rules are cached on disk across sessions
+ROBOTS_CACHE_PATH = "data/robots_cache"
+ROBOTS_CACHE_TTL = 24 * 3600
+
+# Serializes access to the robots.txt cache file across Streamlit sessions
+ROBOTS_CACHE_LOCK = threading.Lock()
+
+# Pages larger than this are truncated
+MAX_PAGE_BYTES = 2_000_000
+
+# Content types parsed as HTML
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# URL prefixes the crawler follows
+ALLOWED_SCHEMES = ('http://', 'https://')
+
+@lru_cache(maxsize=4096)
+def get_netloc(url):
+    """Return the network location of a URL (cached, as pages repeat the same links)"""
+    return urlparse(url).netloc
+
 class ClearnetCrawler:
-    def __init__(self, respect_robots=True, crawl_depth=3, link_limit=5, mode="exploratory"):
+    def __init__(self, respect_robots=True, crawl_depth=3, link_limit=5, mode="exploratory", max_concurrency=32):
         """
         Initialize the crawler with configuration parameters.
         
@@ -20,11 +50,13 @@ class ClearnetCrawler:
             crawl_depth (int): Maximum depth to crawl
             link_limit (int): Maximum links to follow per page
             mode (str): Crawling mode (exploratory, deep_dive, stealth)
+            max_concurrency (int): Maximum number of requests in flight
         """
         self.respect_robots = respect_robots
         self.crawl_depth = crawl_depth
         self.link_limit = link_limit
         self.mode = mode
+        self.max_concurrency = max_concurrency
         
         # Set user agent
         self.user_agent = "ClearnetResearchAssistant/1.0 (+https://example.com/bot; research-purpose)"
@@ -44,12 +76,19 @@ class ClearnetCrawler:
         # Initialize cache for robots.txt
         self.robots_cache = {}
         
-        # Initialize visited URLs
-        self.visited_urls = set()
+        # Initialize visited URLs, stored as 64-bit hashes to keep large crawls compact
+        self.visited_hashes = set()
+        
+        # Per-host politeness state (populated during a crawl)
+        self.robots_locks = {}
+        self.host_locks = {}
+        self.last_fetch = {}
+        self.http = None
+        self.semaphore = None
         
         logger.info(f"Initialized crawler with mode={mode}, depth={self.crawl_depth}, link_limit={self.link_limit}")
     
-    def is_allowed(self, url):
+    async def is_allowed(self, url):
         """Check if URL is allowed by robots.txt"""
         if not self.respect_robots:
             return True
@@ -58,43 +97,150 @@ class ClearnetCrawler:
         base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
         
         # Check cache first
-        if base_url in self.robots_cache:
-            rp = self.robots_cache[base_url]
-        else:
-            # Initialize and cache robots parser
-            rp = urllib.robotparser.RobotFileParser()
-            rp.set_url(urljoin(base_url, "/robots.txt"))
-            try:
-                rp.read()
-                self.robots_cache[base_url] = rp
-            except Exception as e:
-                logger.warning(f"Error reading robots.txt for {base_url}: {e}")
-                return True  # Assume allowed if can't read robots.txt
+        rp = self.robots_cache.get(base_url)
+        if rp is None:
+            # One task per host loads robots.txt; the others wait for its result
+            async with self.robots_locks.setdefault(base_url, asyncio.Lock()):
+                rp = self.robots_cache.get(base_url)
+                if rp is None:
+                    rp = self._load_robots(base_url) or await self._fetch_robots(base_url)
+                    self.robots_cache[base_url] = rp
         
         return rp.can_fetch(self.user_agent, url)
     
+    def _load_robots(self, base_url):
+        """Return an unexpired robots.txt parser from the disk cache, if any"""
+        try:
+            with ROBOTS_CACHE_LOCK:
+                if dbm.whichdb(ROBOTS_CACHE_PATH) is None:
+                    return None
+                with shelve.open(ROBOTS_CACHE_PATH, flag='r') as cache:
+                    entry = cache.get(base_url)
+        except Exception as e:
+            logger.warning(f"Error reading robots.txt cache: {e}")
+            return None
+        
+        if entry and entry["expires"] > time.time():
+            return entry["rules"]
+        return None
+    
+    def _store_robots(self, base_url, rp):
+        """Save a robots.txt parser to the disk cache, dropping expired entries"""
+        now = time.time()
+        try:
+            with ROBOTS_CACHE_LOCK, shelve.open(ROBOTS_CACHE_PATH) as cache:
+                expired = [key for key in cache.keys() if cache[key]["expires"] <= now]
+                for key in expired:
+                    del cache[key]
+                cache[base_url] = {"expires": now + ROBOTS_CACHE_TTL, "rules": rp}
+        except Exception as e:
+            logger.warning(f"Error writing robots.txt cache: {e}")
+    
+    async def _fetch_robots(self, base_url):
+        """Fetch and parse robots.txt for a site"""
+        rp = urllib.robotparser.RobotFileParser()
+        rp.set_url(urljoin(base_url, "/robots.txt"))
+        try:
+            # Fetch through the shared client; mirrors RobotFileParser.read()
+            response = await self.http.get(rp.url)
+            if response.status_code in (401, 403):
+                rp.disallow_all = True
+            elif 400 <= response.status_code < 500:
+                rp.allow_all = True
+            else:
+                response.raise_for_status()
+                rp.parse(response.text.splitlines())
+        except Exception as e:
+            logger.warning(f"Error reading robots.txt for {base_url}: {e}")
+            # Assume allowed if can't read robots.txt; kept for this crawl only
+            rp.allow_all = True
+            return rp
+        
+        self._store_robots(base_url, rp)
+        return rp
+    
+    def _seen(self, url):
+        """Mark URL as visited, returning True if it already was"""
+        url_hash = xxhash.xxh3_64_intdigest(url.encode())
+        if url_hash in self.visited_hashes:
+            return True
+        self.visited_hashes.add(url_hash)
+        return False
+    
+    async def _wait_for_host(self, host):
+        """Enforce the politeness delay between requests to the same host"""
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = get_random_delay(self.delay_min, self.delay_max)
+            elapsed = time.monotonic() - self.last_fetch.get(host, 0)
+            if elapsed < delay:
+                await asyncio.sleep(delay - elapsed)
+            self.last_fetch[host] = time.monotonic()
+    
     def extract_content(self, url, html):
         """Extract content, links, and resources from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
+        try:
+            return self._extract_with_selectolax(url, html)
+        except Exception as e:
+            logger.warning(f"selectolax failed to parse {url}, falling back to BeautifulSoup: {e}")
+            return self._extract_with_soup(url, html)
+    
+    def _filter_links(self, url, hrefs):
+        """Resolve hrefs against the page URL and keep internal links"""
+        base_domain = urlparse(url).netloc
         
-        # Extract text content
-        text_elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'span', 'div'])
-        text_content = ' '.join([elem.get_text(strip=True) for elem in text_elements if elem.get_text(strip=True)])
+        # Only include internal http/https links, excluding anchors; stop once the limit is reached
+        links = (urljoin(url, href) for href in hrefs)
+        internal_links = (
+            link for link in links
+            if link.startswith(ALLOWED_SCHEMES) and '#' not in link and get_netloc(link) in ('', base_domain)
+        )
+        return list(islice(internal_links, self.link_limit))
+    
+    def _extract_with_selectolax(self, url, html):
+        """Extract page data with selectolax's C HTML parser"""
+        tree = HTMLParser(html)
         
         # Extract links (only internal links)
-        base_domain = urlparse(url).netloc
-        links = []
-        for a_tag in soup.find_all('a', href=True):
-            link = urljoin(url, a_tag['href'])
-            parsed_link = urlparse(link)
-            # Only include internal links with http/https scheme
-            if (parsed_link.netloc == base_domain or not parsed_link.netloc) and \
-               parsed_link.scheme in ['http', 'https'] and \
-               '#' not in parsed_link.path:  # Exclude anchors
-                links.append(link)
-        
-        # Limit links based on configuration
-        links = links[:self.link_limit]
+        links = self._filter_links(url, [a.attributes.get('href') or '' for a in tree.css('a[href]')])
+        
+        # Extract resources (images, scripts, stylesheets)
+        resources = {
+            'images': [urljoin(url, img.attributes.get('src') or '') for img in tree.css('img[src]')],
+            'scripts': [urljoin(url, script.attributes.get('src') or '') for script in tree.css('script[src]')],
+            'stylesheets': [urljoin(url, link.attributes.get('href') or '') for link in tree.css('link[rel~="stylesheet"][href]')]
+        }
+        
+        # Extract title
+        title_node = tree.css_first('title')
+        title = title_node.text(strip=True) if title_node else "No title"
+        
+        # Extract metadata in a single pass over <meta> tags
+        metas = {(meta.attributes.get('name') or '').lower(): meta.attributes.get('content') or '' for meta in tree.css('meta[name]')}
+        metadata = {
+            'title': title,
+            'description': metas.get('description', ''),
+            'keywords': metas.get('keywords', '')
+        }
+        
+        # Extract text content, dropping non-visible elements first
+        tree.strip_tags(['script', 'style', 'noscript', 'template'])
+        root = tree.body or tree.root
+        text_content = root.text(separator=' ', strip=True) if root else ""
+        
+        return {
+            'content': text_content,
+            'links': links,
+            'resources': resources,
+            'metadata': metadata
+        }
+    
+    def _extract_with_soup(self, url, html):
+        """Extract page data with BeautifulSoup, used for pages selectolax rejects"""
+        soup = BeautifulSoup(html, 'lxml')
+        
+        # Extract links (only internal links)
+        links = self._filter_links(url, [a_tag['href'] for a_tag in soup.find_all('a', href=True)])
         
         # Extract resources (images, scripts, stylesheets)
         resources = {
@@ -106,13 +252,19 @@ class ClearnetCrawler:
         # Extract title
         title = soup.title.string if soup.title else "No title"
         
-        # Extract metadata
+        # Extract metadata in a single pass over <meta> tags
+        metas = {meta.get('name', '').lower(): meta.get('content', '') for meta in soup.find_all('meta')}
         metadata = {
             'title': title,
-            'description': soup.find('meta', attrs={'name': 'description'})['content'] if soup.find('meta', attrs={'name': 'description'}) else "",
-            'keywords': soup.find('meta', attrs={'name': 'keywords'})['content'] if soup.find('meta', attrs={'name': 'keywords'}) else ""
+            'description': metas.get('description', ''),
+            'keywords': metas.get('keywords', '')
         }
         
+        # Extract text content, dropping non-visible elements first
+        for tag in soup(['script', 'style', 'noscript', 'template']):
+            tag.decompose()
+        text_content = soup.get_text(' ', strip=True)
+        
         return {
             'content': text_content,
             'links': links,
@@ -120,35 +272,47 @@ class ClearnetCrawler:
             'metadata': metadata
         }
     
-    def crawl_url(self, url, depth=0):
-        """Crawl a single URL and extract content"""
-        if depth > self.crawl_depth or url in self.visited_urls:
+    async def _crawl_url(self, url, depth=0):
+        """Crawl a single URL and extract content (only valid during crawl_stream)"""
+        if depth > self.crawl_depth:
             return {}
         
-        # Mark as visited
-        self.visited_urls.add(url)
-        
         # Check robots.txt
-        if not self.is_allowed(url):
+        if not await self.is_allowed(url):
             logger.info(f"Skipping {url} (disallowed by robots.txt)")
             return {}
         
-        # Add delay
-        delay = get_random_delay(self.delay_min, self.delay_max)
-        time.sleep(delay)
-        
         try:
-            # Make request
-            headers = {'User-Agent': self.user_agent}
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            # Check if successful
-            if response.status_code != 200:
-                logger.warning(f"Failed to fetch {url}: HTTP {response.status_code}")
-                return {}
+            # Take a request slot before the per-host delay, so the delay ends right before the request
+            async with self.semaphore:
+                await self._wait_for_host(urlparse(url).netloc)
+                
+                # Make request
+                async with self.http.stream("GET", url, headers={'Accept-Encoding': 'gzip, br'}) as response:
+                    # Check if successful
+                    if response.status_code != 200:
+                        logger.warning(f"Failed to fetch {url}: HTTP {response.status_code}")
+                        return {}
+                
+                    # Skip non-HTML responses before downloading the body
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    if content_type and not content_type.startswith(HTML_CONTENT_TYPES):
+                        logger.info(f"Skipping {url} (content type {content_type})")
+                        return {}
+                
+                    # Read the decompressed body up to the size cap
+                    chunks = []
+                    total_bytes = 0
+                    async for chunk in response.aiter_bytes(65536):
+                        total_bytes += len(chunk)
+                        if total_bytes > MAX_PAGE_BYTES:
+                            logger.warning(f"Truncating {url} at {MAX_PAGE_BYTES} bytes")
+                            break
+                        chunks.append(chunk)
+                    html = b''.join(chunks).decode(response.encoding or 'utf-8', errors='replace')
             
             # Extract content
-            data = self.extract_content(url, response.text)
+            data = self.extract_content(url, html)
             logger.info(f"Crawled {url} (depth={depth}): {len(data['content'])} chars, {len(data['links'])} links")
             
             return {url: data}
@@ -167,33 +331,81 @@ class ClearnetCrawler:
         Returns:
             dict: Dictionary of crawled data keyed by URL
         """
-        logger.info(f"Starting crawl from {seed_url} with depth={self.crawl_depth}")
-        
-        # Reset visited URLs
-        self.visited_urls = set()
+        return asyncio.run(self.crawl_async(seed_url))
+    
+    async def crawl_async(self, seed_url):
+        """
+        Crawl starting from seed URL, fetching each depth layer concurrently.
         
-        # Initialize results
+        Args:
+            seed_url (str): Starting URL for crawling
+            
+        Returns:
+            dict: Dictionary of crawled data keyed by URL
+        """
         results = {}
+        async for url, data in self.crawl_stream(seed_url):
+            results[url] = data
+        return results
+    
+    async def _crawl_at_depth(self, url, depth):
+        return depth, await self._crawl_url(url, depth)
+    
+    async def crawl_stream(self, seed_url):
+        """
+        Crawl starting from seed URL, yielding pages as they are fetched.
         
-        # Queue for BFS crawling
-        queue = [(seed_url, 0)]  # (url, depth)
+        Each depth layer is fetched concurrently; pages are yielded in completion order.
         
-        while queue:
-            url, depth = queue.pop(0)
-            
-            # Skip if already visited or too deep
-            if url in self.visited_urls or depth > self.crawl_depth:
-                continue
-            
-            # Crawl URL
-            data = self.crawl_url(url, depth)
-            results.update(data)
+        Args:
+            seed_url (str): Starting URL for crawling
             
-            # Add links to queue
-            if url in data:
-                for link in data[url]['links']:
-                    if link not in self.visited_urls:
-                        queue.append((link, depth + 1))
+        Yields:
+            tuple: (url, data) for each crawled page
+        """
+        logger.info(f"Starting crawl from {seed_url} with depth={self.crawl_depth}")
         
-        logger.info(f"Crawl complete: {len(results)} pages crawled")
-        return results
+        # Reset per-crawl state
+        self.visited_hashes = set()
+        self.host_locks = {}
+        self.last_fetch = {}
+        self.robots_locks = {}
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        num_pages = 0
+        
+        # One pooled HTTP/2 client per crawl, so connections to a host are reused
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=16)
+        headers = {'User-Agent': self.user_agent}
+        async with httpx.AsyncClient(http2=True, headers=headers, timeout=10, limits=limits, follow_redirects=True) as http:
+            self.http = http
+            try:
+                # BFS one depth layer at a time; URLs are marked visited when enqueued
+                queue = deque([(seed_url, 0)])  # (url, depth)
+                self._seen(seed_url)
+                while queue:
+                    layer = [queue.popleft() for _ in range(len(queue))]
+                    tasks = [asyncio.create_task(self._crawl_at_depth(url, depth)) for url, depth in layer]
+                    
+                    try:
+                        for task in asyncio.as_completed(tasks):
+                            depth, data = await task
+                            for url, page in data.items():
+                                # Add unseen links to the queue
+                                if depth < self.crawl_depth:
+                                    for link in page['links']:
+                                        if not self._seen(link):
+                                            queue.append((link, depth + 1))
+                                
+                                num_pages += 1
+                                yield url, page
+                    finally:
+                        # Stop outstanding fetches if the consumer stops early, and let them unwind
+                        # before the HTTP client closes
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                self.http = None
+        
+        logger.info(f"Crawl complete: {num_pages} pages crawled")
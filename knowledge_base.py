@@ -1,22 +1,35 @@
 import os
 import json
+from collections import OrderedDict
+import hashlib
 import logging
+import time
 from datetime import datetime
 import chromadb
 from chromadb.utils import embedding_functions
 from utils import setup_logger
+from vector_store import FaissVectorStore
 
 # Setup logger
 logger = setup_logger()
 
+# Number of query embeddings kept in memory per knowledge base
+EMBEDDING_CACHE_SIZE = 512
+
 class KnowledgeBase:
     def __init__(self, persist_directory="data/chroma_db"):
         """
         Initialize the knowledge base with ChromaDB for vector storage.
         
+        Setting KB_BACKEND=faiss keeps documents in an in-memory FAISS store
+        instead, which is faster for small collections (candidates found in int8
+        codes are re-ranked against float16 vectors, so results are near-exact).
+        
         Args:
             persist_directory (str): Directory to persist ChromaDB
         """
+        self.backend = os.environ.get("KB_BACKEND", "chroma").lower()
+        
         # Create directory if it doesn't exist
         os.makedirs(persist_directory, exist_ok=True)
         
@@ -26,7 +39,21 @@ class KnowledgeBase:
         # Use default embedding function (all-MiniLM-L6-v2)
         self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
         
+        # LRU cache of query embeddings, keyed by text
+        self.embedding_cache = OrderedDict()
+        
         # Get or create collection
+        if self.backend == "faiss":
+            self.collection = FaissVectorStore(self.embedding_function)
+            logger.info("Created in-memory FAISS collection")
+        else:
+            self._load_collection()
+        
+        # Semantic cache of generated reports
+        self.report_cache = ReportCache(self.client, self._embed)
+    
+    def _load_collection(self):
+        """Load the persisted ChromaDB collection, creating it if needed"""
         try:
             self.collection = self.client.get_collection(
                 name="research_documents",
@@ -40,6 +67,15 @@ class KnowledgeBase:
             )
             logger.info("Created new collection")
     
+    @staticmethod
+    def _document_id(text, metadata):
+        """Generate a stable ID from the URL, or from the text and timestamp"""
+        if metadata and 'url' in metadata:
+            key = metadata['url']
+        else:
+            key = f"{text[:100]}{datetime.now().isoformat()}"
+        return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    
     def add_document(self, text, metadata=None):
         """
         Add a document to the knowledge base.
@@ -52,14 +88,10 @@ class KnowledgeBase:
             logger.warning("Attempted to add empty document, skipping")
             return
         
-        # Generate ID from metadata or timestamp
-        if metadata and 'url' in metadata:
-            doc_id = str(hash(metadata['url']))
-        else:
-            doc_id = str(hash(f"{text[:100]}{datetime.now().isoformat()}"))
+        doc_id = self._document_id(text, metadata)
         
         try:
-            self.collection.add(
+            self.collection.upsert(
                 documents=[text],
                 metadatas=[metadata or {}],
                 ids=[doc_id]
@@ -68,6 +100,55 @@ class KnowledgeBase:
         except Exception as e:
             logger.error(f"Error adding document to knowledge base: {e}")
     
+    def add_documents(self, texts, metadatas=None, batch_size=64):
+        """
+        Add several documents to the knowledge base in batched writes.
+        
+        Args:
+            texts (list): Document texts
+            metadatas (list): Document metadata, parallel to texts
+            batch_size (int): Number of documents embedded and written per call
+        """
+        metadatas = metadatas or [{} for _ in texts]
+        
+        # Drop empty documents
+        docs = [(text, metadata or {}) for text, metadata in zip(texts, metadatas) if text and text.strip()]
+        if len(docs) < len(texts):
+            logger.warning(f"Skipping {len(texts) - len(docs)} empty documents")
+        
+        for start in range(0, len(docs), batch_size):
+            batch = docs[start:start + batch_size]
+            ids = [self._document_id(text, metadata) for text, metadata in batch]
+            try:
+                self.collection.upsert(
+                    documents=[text for text, _ in batch],
+                    metadatas=[metadata for _, metadata in batch],
+                    ids=ids
+                )
+                logger.info(f"Added {len(batch)} documents to knowledge base")
+            except Exception as e:
+                logger.error(f"Error adding documents to knowledge base: {e}")
+    
+    def _embed_many(self, texts):
+        """Embed texts, serving cached embeddings and embedding the misses in one batch"""
+        misses = [text for text in dict.fromkeys(texts) if text not in self.embedding_cache]
+        if misses:
+            for text, embedding in zip(misses, self.embedding_function(misses)):
+                self.embedding_cache[text] = [float(x) for x in embedding]
+        
+        embeddings = []
+        for text in texts:
+            self.embedding_cache.move_to_end(text)
+            embeddings.append(self.embedding_cache[text])
+        
+        while len(self.embedding_cache) > EMBEDDING_CACHE_SIZE:
+            self.embedding_cache.popitem(last=False)
+        return embeddings
+    
+    def _embed(self, text):
+        """Embed a single text through the cache"""
+        return self._embed_many([text])[0]
+    
     def query(self, query_text, n_results=5):
         """
         Query the knowledge base for relevant documents.
@@ -80,18 +161,13 @@ class KnowledgeBase:
             list: List of documents with text and metadata
         """
         try:
+            embedding = self._embed(query_text)
             results = self.collection.query(
-                query_texts=[query_text],
+                query_embeddings=[embedding],
                 n_results=n_results
             )
             
-            documents = []
-            for i, doc in enumerate(results['documents'][0]):
-                documents.append({
-                    'text': doc,
-                    'metadata': results['metadatas'][0][i] if i < len(results['metadatas'][0]) else {},
-                    'distance': results['distances'][0][i] if 'distances' in results and i < len(results['distances'][0]) else None
-                })
+            documents = self._format_results(results, 0)
             
             logger.info(f"Query '{query_text[:50]}...' returned {len(documents)} results")
             return documents
@@ -99,6 +175,50 @@ class KnowledgeBase:
             logger.error(f"Error querying knowledge base: {e}")
             return []
     
+    def query_many(self, query_texts, n_results=5):
+        """
+        Query the knowledge base with several texts in one batched call.
+        
+        Args:
+            query_texts (list): Query texts
+            n_results (int): Number of results to return per query
+            
+        Returns:
+            list: One list of documents per query text
+        """
+        if not query_texts:
+            return []
+        
+        try:
+            embeddings = self._embed_many(list(query_texts))
+            results = self.collection.query(
+                query_embeddings=embeddings,
+                n_results=n_results
+            )
+            
+            documents = [self._format_results(results, row) for row in range(len(query_texts))]
+            
+            logger.info(f"Batched {len(query_texts)} queries returned {sum(len(docs) for docs in documents)} results")
+            return documents
+        except Exception as e:
+            logger.error(f"Error querying knowledge base: {e}")
+            return [[] for _ in query_texts]
+    
+    @staticmethod
+    def _format_results(results, row):
+        """Convert one row of a Chroma query result into a list of documents"""
+        metadatas = results['metadatas'][row] if results.get('metadatas') else []
+        distances = results['distances'][row] if results.get('distances') else []
+        
+        documents = []
+        for i, doc in enumerate(results['documents'][row]):
+            documents.append({
+                'text': doc,
+                'metadata': metadatas[i] if i < len(metadatas) else {},
+                'distance': distances[i] if i < len(distances) else None
+            })
+        return documents
+    
     def count(self):
         """Return the number of documents in the knowledge base"""
         try:
@@ -109,11 +229,111 @@ class KnowledgeBase:
     def clear(self):
         """Clear all documents from the knowledge base"""
         try:
-            self.client.delete_collection("research_documents")
-            self.collection = self.client.create_collection(
-                name="research_documents",
-                embedding_function=self.embedding_function
-            )
+            if self.backend == "faiss":
+                self.collection = FaissVectorStore(self.embedding_function)
+            else:
+                self.client.delete_collection("research_documents")
+                self.collection = self.client.create_collection(
+                    name="research_documents",
+                    embedding_function=self.embedding_function
+                )
+            self.report_cache.clear()
             logger.info("Cleared knowledge base")
         except Exception as e:
             logger.error(f"Error clearing knowledge base: {e}")
+
+
+class ReportCache:
+    def __init__(self, client, embed, ttl_seconds=24 * 3600, threshold=0.93):
+        """
+        Initialize a semantic cache of generated reports in its own collection.
+        
+        Args:
+            client (chromadb.Client): ChromaDB client to store the cache in
+            embed (callable): Function mapping a text to its embedding
+            ttl_seconds (int): Age after which cached reports are ignored
+            threshold (float): Minimum cosine similarity for a cache hit
+        """
+        self.client = client
+        self.embed = embed
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.collection = self._get_collection()
+    
+    def _get_collection(self):
+        return self.client.get_or_create_collection(
+            name="report_cache",
+            metadata={"hnsw:space": "cosine"}
+        )
+    
+    @staticmethod
+    def _where(context_hash, model, min_timestamp=None):
+        conditions = [{"context_hash": context_hash}, {"model": model}]
+        if min_timestamp is not None:
+            conditions.append({"timestamp": {"$gte": min_timestamp}})
+        return {"$and": conditions}
+    
+    def lookup(self, query, context_hash, model):
+        """
+        Return a cached report for a similar query over the same context.
+        
+        Args:
+            query (str): Research query
+            context_hash (str): Hash of the crawled pages the report was built from
+            model (str): AI model that generated the report
+            
+        Returns:
+            str: Cached report, or None on a miss
+        """
+        try:
+            if self.collection.count() == 0:
+                return None
+            
+            results = self.collection.query(
+                query_embeddings=[self.embed(query)],
+                n_results=1,
+                where=self._where(context_hash, model, time.time() - self.ttl_seconds)
+            )
+            if not results['documents'][0]:
+                return None
+            
+            similarity = 1 - results['distances'][0][0]
+            if similarity < self.threshold:
+                return None
+            
+            logger.info(f"Report cache hit for '{query[:50]}...' (similarity={similarity:.3f})")
+            return results['documents'][0][0]
+        except Exception as e:
+            logger.warning(f"Error reading report cache: {e}")
+            return None
+    
+    def store(self, query, context_hash, model, report):
+        """
+        Cache a generated report.
+        
+        Args:
+            query (str): Research query
+            context_hash (str): Hash of the crawled pages the report was built from
+            model (str): AI model that generated the report
+            report (str): Generated report
+        """
+        entry_id = hashlib.sha256(f"{model}\n{context_hash}\n{query}".encode()).hexdigest()
+        try:
+            self.collection.upsert(
+                ids=[entry_id],
+                embeddings=[self.embed(query)],
+                documents=[report],
+                metadatas=[{"context_hash": context_hash, "model": model, "timestamp": time.time()}]
+            )
+            logger.info(f"Cached report {entry_id[:12]}")
+        except Exception as e:
+            logger.error(f"Error writing report cache: {e}")
+    
+    def clear(self):
+        """Clear all cached reports"""
+        try:
+            self.client.delete_collection("report_cache")
+            self.collection = self._get_collection()
+            logger.info("Cleared report cache")
+        except Exception as e:
+            logger.error(f"Error clearing report cache: {e}")
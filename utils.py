@@ -1,11 +1,21 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import random
 import time
 from datetime import datetime
 import os
 
+# Logger shared by all modules, configured once per process
+_LOGGER = None
+
 def setup_logger():
     """Set up and return logger"""
+    global _LOGGER
+    if _LOGGER is not None:
+        return _LOGGER
+    
     # Create logs directory if it doesn't exist
     os.makedirs("logs", exist_ok=True)
     
@@ -27,11 +37,17 @@ def setup_logger():
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
         
+        # Write records from a background thread so logging never blocks the crawler's event loop
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        
         # Add handlers
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
-    return logger
+    _LOGGER = logger
+    return _LOGGER
 
 def get_random_delay(min_delay=2, max_delay=5):
     """Get random delay between min and max seconds"""
@@ -0,0 +1,228 @@
+import numpy as np
+
+# FAISS and Numba are optional accelerators for the in-memory store
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Normalized vectors are stored as int8 codes: component * 127
+QUANTIZATION_SCALE = 127
+
+# Candidates re-scored against the float16 vectors after the quantized scan
+RERANK_CANDIDATES = 20
+
+# Rows of int8 codes dequantized at a time when scanning with numpy
+SCAN_BLOCK_ROWS = 16384
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _sift_down(values, indices, pos, size):
+        """Restore the min-heap property below pos"""
+        while True:
+            smallest = pos
+            left = 2 * pos + 1
+            right = left + 1
+            if left < size and values[left] < values[smallest]:
+                smallest = left
+            if right < size and values[right] < values[smallest]:
+                smallest = right
+            if smallest == pos:
+                return
+            values[pos], values[smallest] = values[smallest], values[pos]
+            indices[pos], indices[smallest] = indices[smallest], indices[pos]
+            pos = smallest
+    
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _topk_numba(scores, k):
+        """Indices of the k highest scores in each row, best first"""
+        indices = np.empty((scores.shape[0], k), dtype=np.int64)
+        for row in numba.prange(scores.shape[0]):
+            # Keep the k best scores seen so far in a min-heap
+            heap_values = scores[row, :k].copy()
+            heap_indices = np.arange(k)
+            for pos in range(k // 2 - 1, -1, -1):
+                _sift_down(heap_values, heap_indices, pos, k)
+            for i in range(k, scores.shape[1]):
+                if scores[row, i] > heap_values[0]:
+                    heap_values[0] = scores[row, i]
+                    heap_indices[0] = i
+                    _sift_down(heap_values, heap_indices, 0, k)
+            
+            # Sort only the k survivors
+            order = np.argsort(-heap_values)
+            indices[row] = heap_indices[order]
+        return indices
+
+def topk(scores, k):
+    """
+    Return the indices of the k highest scores in each row, best first.
+    
+    Args:
+        scores (np.ndarray): Score matrix of shape (n_queries, n_vectors)
+        k (int): Number of indices per row
+    
+    Returns:
+        np.ndarray: Index matrix of shape (n_queries, k)
+    """
+    if numba is not None:
+        return _topk_numba(scores, k)
+    
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+class FaissVectorStore:
+    def __init__(self, embedding_function, dim=384):
+        """
+        Initialize an in-memory vector store with int8-quantized vectors.
+        
+        Mirrors the subset of the ChromaDB collection API used by KnowledgeBase.
+        Vectors are L2-normalized so inner product equals cosine similarity, and
+        query distances are cosine distances. The int8 codes are scanned for
+        candidates, which are then re-ranked against float16 copies of the
+        vectors. Contents are not persisted.
+        
+        Args:
+            embedding_function (callable): Maps a list of texts to embeddings
+            dim (int): Embedding dimension (384 for all-MiniLM-L6-v2)
+        """
+        self.embedding_function = embedding_function
+        self.dim = dim
+        
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        
+        # 8-bit scalar-quantized index, or a plain int8 matrix searched with numpy
+        if faiss is not None:
+            self.index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            # Normalized components lie in [-1, 1]; train on that range instead of on data
+            self.index.train(np.stack([-np.ones(dim, dtype=np.float32), np.ones(dim, dtype=np.float32)]))
+        else:
+            self.index = None
+        self.codes = np.empty((0, dim), dtype=np.int8)
+        
+        # Higher-precision copies used only to re-rank candidates
+        self.vectors = np.empty((0, dim), dtype=np.float16)
+    
+    def _normalize(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    def _quantize(self, vectors):
+        return np.round(vectors * QUANTIZATION_SCALE).astype(np.int8)
+    
+    def _scan_codes(self, queries):
+        """Score queries against all int8 codes with float32 GEMMs over dequantized blocks"""
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK_ROWS):
+            block = self.codes[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+    
+    def _search(self, queries, k):
+        """Scan the quantized vectors, then re-rank the best candidates against the float16 vectors"""
+        n_candidates = min(max(k, RERANK_CANDIDATES), self.count())
+        if self.index is not None:
+            _, candidates = self.index.search(queries, n_candidates)
+        else:
+            candidates = topk(self._scan_codes(queries), n_candidates)
+        
+        rescored = np.einsum('qcd,qd->qc', self.vectors[candidates].astype(np.float32), queries)
+        order = np.argsort(-rescored, axis=1)[:, :k]
+        return np.take_along_axis(rescored, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+    
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        """
+        Add documents to the store.
+        
+        Args:
+            ids (list): Document IDs
+            documents (list): Document texts
+            metadatas (list): Document metadata
+            embeddings (list): Precomputed embeddings; computed from documents if omitted
+        """
+        documents = documents or [""] * len(ids)
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        vectors = self._normalize(embeddings)
+        
+        if self.index is not None:
+            self.index.add(vectors)
+        else:
+            self.codes = np.vstack([self.codes, self._quantize(vectors)])
+        self.vectors = np.vstack([self.vectors, vectors.astype(np.float16)])
+        
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas or [{} for _ in ids])
+    
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None):
+        """
+        Add documents, replacing any stored under the same IDs.
+        
+        Args:
+            ids (list): Document IDs
+            documents (list): Document texts
+            metadatas (list): Document metadata
+            embeddings (list): Precomputed embeddings; computed from documents if omitted
+        """
+        replaced = set(ids)
+        positions = [i for i, doc_id in enumerate(self.ids) if doc_id in replaced]
+        if positions:
+            self._remove(positions)
+        self.add(ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+    
+    def _remove(self, positions):
+        """Remove the entries at the given positions, keeping the rest in order"""
+        if self.index is not None:
+            self.index.remove_ids(np.asarray(positions, dtype=np.int64))
+        else:
+            self.codes = np.delete(self.codes, positions, axis=0)
+        self.vectors = np.delete(self.vectors, positions, axis=0)
+        
+        removed = set(positions)
+        self.ids = [doc_id for i, doc_id in enumerate(self.ids) if i not in removed]
+        self.documents = [doc for i, doc in enumerate(self.documents) if i not in removed]
+        self.metadatas = [metadata for i, metadata in enumerate(self.metadatas) if i not in removed]
+    
+    def query(self, query_embeddings=None, query_texts=None, n_results=10):
+        """
+        Find the nearest documents for each query.
+        
+        Args:
+            query_embeddings (list): Query embeddings
+            query_texts (list): Query texts, embedded if query_embeddings is omitted
+            n_results (int): Number of results per query
+        
+        Returns:
+            dict: Chroma-style result with one row per query
+        """
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = self._normalize(query_embeddings)
+        
+        k = min(n_results, self.count())
+        if k == 0:
+            empty = [[] for _ in range(len(queries))]
+            return {'ids': empty, 'documents': empty, 'metadatas': empty, 'distances': empty}
+        
+        scores, indices = self._search(queries, k)
+        
+        return {
+            'ids': [[self.ids[i] for i in row] for row in indices],
+            'documents': [[self.documents[i] for i in row] for row in indices],
+            'metadatas': [[self.metadatas[i] for i in row] for row in indices],
+            'distances': [[float(1 - score) for score in row] for row in scores]
+        }
+    
+    def count(self):
+        """Return the number of documents in the store"""
+        return len(self.ids)